@@ -1,13 +1,36 @@
-# Import Passlib's password hashing tool
-from passlib.context import CryptContext
+# Use argon2-cffi and bcrypt directly (no Passlib dispatch layer)
+import bcrypt
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
 
-# Define the hashing algorithm to use ('bcrypt' is secure)
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# New hashes use Argon2id (OWASP baseline: 46 MiB, t=1, p=1)
+argon2_hasher = PasswordHasher(time_cost=1, memory_cost=47104, parallelism=1)
 
-# Hash the password using bcrypt (for storing in DB)
+# Older accounts still have bcrypt hashes; they are upgraded on next login
+BCRYPT_ROUNDS = 12
+
+# bcrypt only looks at the first 72 bytes (Passlib truncated the same way)
+def _encode(password: str) -> bytes:
+    return password.encode()[:72]
+
+# Hash the password using Argon2id (for storing in DB)
 def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+    return argon2_hasher.hash(password)
 
-# Verify a password by comparing user input with hashed version in DBWH
+# Verify a password by comparing user input with hashed version in DB
 def verify_password(plain: str, hashed: str) -> bool:
-    return pwd_context.verify(plain, hashed)
+    if hashed.startswith("$argon2"):
+        try:
+            return argon2_hasher.verify(hashed, plain)
+        except (VerificationError, InvalidHashError):
+            return False
+    try:
+        return bcrypt.checkpw(_encode(plain), hashed.encode())
+    except ValueError:
+        return False  # Not a bcrypt hash (e.g. OAuth users have no password)
+
+# True if the stored hash should be replaced with a fresh Argon2id hash
+def needs_rehash(hashed: str) -> bool:
+    if not hashed.startswith("$argon2"):
+        return True
+    return argon2_hasher.check_needs_rehash(hashed)
@@ -0,0 +1,57 @@
+# cache_utils.py
+import logging
+from typing import Optional
+
+import redis
+
+from middlewares import r
+
+logger = logging.getLogger(__name__)
+
+# Keys for cached responses
+USERS_CACHE_KEY = "cache:/users"
+USERS_CACHE_TTL = 30  # seconds
+
+# Add a field to a cached hash; the TTL is only set when the hash is created,
+# so later writes never extend the life of fields cached earlier
+SET_CACHED_LUA = """
+local created = redis.call('EXISTS', KEYS[1]) == 0
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+if created then
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+end
+"""
+SET_CACHED_SCRIPT = r.register_script(SET_CACHED_LUA) if r is not None else None
+
+def get_cached(key: str, field: str) -> Optional[str]:
+    """Return a cached response body, or None on miss / Redis unavailable"""
+    if r is None:
+        return None
+    try:
+        return r.hget(key, field)
+    except redis.RedisError as e:
+        logger.error("Redis error reading cache %s: %s", key, e)
+        return None
+
+def set_cached(key: str, field: str, body: bytes, ttl: int) -> None:
+    """Cache a response body for at most ttl seconds.
+
+    Variants of one endpoint (e.g. pages) share a hash, so drop_cached()
+    invalidates all of them at once; the whole hash expires ttl seconds
+    after its first field was written.
+    """
+    if r is None:
+        return
+    try:
+        SET_CACHED_SCRIPT(keys=[key], args=[field, body, ttl])
+    except redis.RedisError as e:
+        logger.error("Redis error writing cache %s: %s", key, e)
+
+def drop_cached(key: str) -> None:
+    """Invalidate a cached response (e.g. after a write)"""
+    if r is None:
+        return
+    try:
+        r.delete(key)
+    except redis.RedisError as e:
+        logger.error("Redis error dropping cache %s: %s", key, e)
@@ -1,14 +1,56 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from sqlalchemy.orm import sessionmaker, declarative_base
 
 # SQLite database path
 DATABASE_URL = "sqlite:///./users.db"
+ASYNC_DATABASE_URL = "sqlite+aiosqlite:///./users.db"  # Same file, async driver
 
-# Create connection to SQLite
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# Create connection to SQLite (pooled, so connections and their page cache are reused)
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=QueuePool,
+    pool_size=20,       # Connections kept open for reuse
+    max_overflow=10,    # Extra connections allowed under bursts
+    pool_timeout=30,    # Seconds to wait for a free connection
+    pool_pre_ping=True,
+    pool_recycle=3600,  # Replace connections older than an hour
+    query_cache_size=1200  # Room for every compiled statement we reuse
+)
+
+# Tune every new SQLite connection once, when the pool opens it
+@event.listens_for(engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")      # Readers don't block the writer
+    cursor.execute("PRAGMA synchronous=NORMAL")    # Safe with WAL, far fewer fsyncs
+    cursor.execute("PRAGMA cache_size=-64000")     # ~64 MB page cache per connection
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA mmap_size=268435456")   # 256 MB memory-mapped reads
+    cursor.close()
+
+# Async engine for routes that await the DB instead of blocking a worker thread
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=20,
+    max_overflow=10,
+    pool_timeout=30,
+    pool_pre_ping=True,
+    pool_recycle=3600,
+    query_cache_size=1200
+)
+event.listen(async_engine.sync_engine, "connect", set_sqlite_pragmas)
 
 # Session maker (used to talk to DB)
-SessionLocal = sessionmaker(bind=engine, autoflush=False)
+# expire_on_commit=False: objects keep their loaded values after commit, so
+# returning/rendering them doesn't trigger a reload SELECT (sessions are per-request)
+SessionLocal = sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+
+# Async session maker (profile routes)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
 
 # Base class for defining models
 Base = declarative_base()
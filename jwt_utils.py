@@ -1,16 +1,32 @@
 from jose import jwt, JWTError
-from datetime import datetime, timedelta
 from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
+from cachetools import TTLCache
+from collections import namedtuple
+import hashlib
+import threading
+import time
 
 # Secret key for signing tokens (Keep this in .env in production)
 SECRET_KEY = "boffins-secret-key"
 ALGORITHM = "HS256"
 EXPIRE_MINUTES = 30
+EXPIRE_SECONDS = EXPIRE_MINUTES * 60
 
 # Tells FastAPI where to look for token (used in Swagger docs)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")  # matches your /login route
 
+# Cache of already-verified tokens so repeat requests skip the HMAC decode.
+# Keyed by a blake2b digest (the raw token is never stored); entries are
+# also checked against the token's own "exp" claim on every hit.
+_token_cache = TTLCache(maxsize=10_000, ttl=5)
+_token_cache_lock = threading.Lock()
+
+# Claims are checked by jose during the single verified decode
+_DECODE_OPTIONS = {"require_exp": True, "require_sub": True, "verify_exp": True}
+
+Claims = namedtuple("Claims", "username role exp")
+
 #  Create a JWT token for a given username
 #def create_jwt_token(username: str) -> str:
     # Set token expiration time
@@ -21,7 +37,7 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")  # matches your /login ro
     #return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
 
 def create_jwt_token(username: str, role: str) -> str:
-    expire = datetime.utcnow() + timedelta(minutes=EXPIRE_MINUTES)
+    expire = int(time.time()) + EXPIRE_SECONDS  # exp is a plain epoch int in the token anyway
     payload = {"sub": username, "role": role, "exp": expire}  #  add role
     return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
 
@@ -36,11 +52,21 @@ def create_jwt_token(username: str, role: str) -> str:
         #return None  # Token is invalid or expired
 
 def verify_jwt_token(token: str):
+    key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    with _token_cache_lock:
+        cached = _token_cache.get(key)
+    if cached and cached.exp > time.time():
+        return {"username": cached.username, "role": cached.role}
+
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return {"username": payload.get("sub"), "role": payload.get("role")}
-    except JWTError:
-        return None
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM], options=_DECODE_OPTIONS)
+        claims = Claims(payload["sub"], payload["role"], payload["exp"])
+    except (JWTError, KeyError):
+        return None  # Invalid tokens are never cached
+
+    with _token_cache_lock:
+        _token_cache[key] = claims
+    return {"username": claims.username, "role": claims.role}
 
 
 #  Reusable FastAPI dependency to extract user from token
@@ -1,19 +1,23 @@
 # main.py (Production-Grade with Session Management)
-from fastapi import FastAPI, HTTPException, Depends, Request
-from fastapi.security import OAuth2PasswordBearer
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi import FastAPI, HTTPException, Depends, Request, Query
+from fastapi.responses import HTMLResponse, RedirectResponse, Response, ORJSONResponse
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
+import orjson
+import threading
 import time
-from typing import List, Optional
+from typing import Optional
 
 from database import SessionLocal, engine, Base
-from models import User
-from auth_utils import hash_password, verify_password
+from models import User, USER_BY_USERNAME
+from auth_utils import hash_password, verify_password, needs_rehash
 from jwt_utils import create_jwt_token  # Still used for API endpoints
+from cache_utils import get_cached, set_cached, drop_cached, USERS_CACHE_KEY, USERS_CACHE_TTL
 
 # Import production session management
-from session_manager import SessionManager, get_current_user_session, get_admin_user_session, get_optional_user_session
+from session_manager import SessionManager, OrjsonSessionSerializer, FailSoftRedisStore
+from session_dependencies import get_current_user_session, get_admin_user_session, get_optional_user_session
 
 # Import profile models and routes
 from profile_models import UserProfile
@@ -21,40 +25,89 @@ from profile_routes import router as profile_router
 
 # For Google Login with sessions
 from starlette.middleware.sessions import SessionMiddleware
-from oauth import router as oauth_router
+from starsessions import SessionMiddleware as RedisSessionMiddleware, SessionAutoloadMiddleware, load_session
+import redis.asyncio as aioredis
+from oauth import router as oauth_router, prefetch_google_metadata
 from fastapi.templating import Jinja2Templates
 from dotenv import load_dotenv
+from cachetools import TTLCache
+from contextlib import asynccontextmanager
 import os
+import re
 
 # Load environment variables
 load_dotenv()
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
-
 # Create database tables
 Base.metadata.create_all(bind=engine)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Startup work before the first request"""
+    await prefetch_google_metadata()
+    yield
+
 # Create FastAPI application
 app = FastAPI(
     title="Production User Management Service", 
     version="2.0.0",
-    description="Production-grade user management with session-based authentication"
+    description="Production-grade user management with session-based authentication",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
+# Logging middleware + rate limit dependency (also owns the shared Redis connection)
+from middlewares import request_logger, rate_limit, r as redis_client, REDIS_HOST, REDIS_PORT, REDIS_OPTIONS
+
 # PRODUCTION SESSION MIDDLEWARE
+# Path prefixes whose handlers read or write request.session (add new session routes here)
+SESSION_PATHS = [
+    re.compile(r"^/$"),
+    "/login",       # also /login/google
+    "/logout",
+    "/auth/",
+    "/session/",
+    "/dashboard",
+    "/protected",
+    "/profile",
+    "/admin",
+    "/users",
+    "/info"
+]
 SECRET_KEY = os.getenv("SECRET_KEY", "your-super-secret-key-change-in-production")
-app.add_middleware(
-    SessionMiddleware, 
-    secret_key=SECRET_KEY,
-    max_age=86400,  # 24 hours
-    same_site="lax",
-    https_only=False,  # Set to True in production with HTTPS
-    session_cookie="auth_session"  # Custom cookie name
-)
+if redis_client is not None:
+    # Server-side sessions: the cookie only carries a random session ID,
+    # the session payload lives in Redis for 24 hours
+    # Same host and timeouts as the sync client; Redis errors read as "no session"
+    session_store = FailSoftRedisStore(
+        connection=aioredis.Redis(host=REDIS_HOST, port=REDIS_PORT, **REDIS_OPTIONS),
+        prefix="session:"
+    )
+    # Only routes that use the session load it; /signup, /api/login, /health
+    # and the JWT-only API don't touch the session store at all
+    app.add_middleware(SessionAutoloadMiddleware, paths=SESSION_PATHS)
+    app.add_middleware(
+        RedisSessionMiddleware,
+        store=session_store,
+        serializer=OrjsonSessionSerializer(),
+        lifetime=86400,  # 24 hours
+        rolling=True,    # Expiry restarts on every request, like the cookie fallback
+        cookie_same_site="lax",
+        cookie_https_only=False,  # Set to True in production with HTTPS
+        cookie_name="auth_session"  # Custom cookie name
+    )
+else:
+    # Redis is down - fall back to signed-cookie sessions
+    app.add_middleware(
+        SessionMiddleware, 
+        secret_key=SECRET_KEY,
+        max_age=86400,  # 24 hours
+        same_site="lax",
+        https_only=False,  # Set to True in production with HTTPS
+        session_cookie="auth_session"  # Custom cookie name
+    )
 
-# Rate limiting middleware
-from middlewares import combined_logger_and_limiter
-app.middleware("http")(combined_logger_and_limiter)
+app.middleware("http")(request_logger)
 
 # Include routers
 app.include_router(oauth_router)
@@ -63,6 +116,11 @@ app.include_router(profile_router)
 # Setup templates
 templates = Jinja2Templates(directory="templates")
 
+# Dashboard template is compiled once; rendered pages are cached briefly per user
+_DASH_TMPL = templates.get_template("dashboard.html")
+_dashboard_cache = TTLCache(maxsize=5000, ttl=10)
+_dashboard_cache_lock = threading.Lock()
+
 # Request models
 class UserIn(BaseModel):
     username: str
@@ -83,10 +141,10 @@ def get_db():
 
 # ============== AUTHENTICATION ROUTES ==============
 
-@app.post("/signup")
+@app.post("/signup", dependencies=[Depends(rate_limit)])
 def signup(user: UserIn, db: Session = Depends(get_db)):
     """Create new user account"""
-    existing = db.query(User).filter(User.username == user.username).first()
+    existing = db.execute(USER_BY_USERNAME, {"u": user.username}).scalar_one_or_none()
     if existing:
         raise HTTPException(status_code=400, detail="Username already exists")
 
@@ -98,18 +156,23 @@ def signup(user: UserIn, db: Session = Depends(get_db)):
 
     db.add(new_user)
     db.commit()
-    db.refresh(new_user)
+    drop_cached(USERS_CACHE_KEY)  # New user must show up in /users
     
     return {"message": "User created successfully", "user_id": new_user.id}
 
-@app.post("/login")
+@app.post("/login", dependencies=[Depends(rate_limit)])
 def login(request: Request, login_data: LoginRequest, db: Session = Depends(get_db)):
     """Login with username/password - creates session"""
-    user = db.query(User).filter(User.username == login_data.username).first()
+    user = db.execute(USER_BY_USERNAME, {"u": login_data.username}).scalar_one_or_none()
 
     if not user or not verify_password(login_data.password, user.hashed_password):
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
+    # Upgrade legacy bcrypt (or outdated Argon2) hashes now that we have the password
+    if needs_rehash(user.hashed_password):
+        user.hashed_password = hash_password(login_data.password)
+        db.commit()
+
     # CREATE SESSION (Production approach)
     session_data = {
         "user_id": user.id,
@@ -140,13 +203,23 @@ def logout(request: Request):
 @app.get("/dashboard", response_class=HTMLResponse)
 def dashboard(request: Request, current_user: dict = Depends(get_current_user_session)):
     """Production dashboard with session authentication"""
-    return templates.TemplateResponse("dashboard.html", {
-        "request": request,
-        "username": current_user["username"],
-        "role": current_user["role"],
-        "user_id": current_user["user_id"],
-        "display_name": current_user.get("display_name", current_user["username"])
-    })
+    display_name = SessionManager.get_display_name(current_user)
+    # Every value the page shows is part of the key, so a role or name change is never stale
+    key = (current_user["user_id"], current_user["username"], current_user["role"], display_name)
+    
+    with _dashboard_cache_lock:
+        html = _dashboard_cache.get(key)
+    if html is None:
+        html = _DASH_TMPL.render(
+            username=current_user["username"],
+            role=current_user["role"],
+            user_id=current_user["user_id"],
+            display_name=display_name
+        ).encode()
+        with _dashboard_cache_lock:
+            _dashboard_cache[key] = html
+    
+    return HTMLResponse(content=html)
 
 @app.get("/protected", response_class=HTMLResponse)
 def protected_legacy(request: Request, current_user: dict = Depends(get_current_user_session)):
@@ -169,24 +242,51 @@ def admin_panel(request: Request, admin_user: dict = Depends(get_admin_user_sess
     })
 
 @app.get("/users")
-def list_users(current_user: dict = Depends(get_admin_user_session), db: Session = Depends(get_db)):
-    """List all users - admin only"""
-    users = db.query(User).all()
-    return {
-        "users": [{"id": u.id, "username": u.username, "role": u.role} for u in users],
-        "total": len(users)
-    }
+def list_users(
+    after_id: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    current_user: dict = Depends(get_admin_user_session),
+    db: Session = Depends(get_db)
+):
+    """List users one page at a time - admin only (cached for a short TTL)"""
+    page_key = f"{after_id}:{limit}"
+    cached = get_cached(USERS_CACHE_KEY, page_key)
+    if cached is not None:
+        return Response(content=cached, media_type="application/json")
+    
+    # Keyset pagination; selecting columns keeps hashed_password out of Python
+    rows = db.execute(
+        select(User.id, User.username, User.role)
+        .where(User.id > after_id)
+        .order_by(User.id)
+        .limit(limit)
+    ).all()
+    
+    # One serialization for the whole page; the same bytes are cached and sent
+    body = orjson.dumps({
+        "users": [{"id": row.id, "username": row.username, "role": row.role} for row in rows],
+        "total": db.scalar(select(func.count()).select_from(User)),  # All users, not just this page
+        "next_after_id": rows[-1].id if len(rows) == limit else None
+    })
+    set_cached(USERS_CACHE_KEY, page_key, body, USERS_CACHE_TTL)
+    
+    return Response(content=body, media_type="application/json")
 
 # ============== API ROUTES (Still use JWT for external access) ==============
 
 @app.post("/api/login")
 def api_login(login_data: LoginRequest, db: Session = Depends(get_db)):
     """API login - returns JWT token for external clients"""
-    user = db.query(User).filter(User.username == login_data.username).first()
+    user = db.execute(USER_BY_USERNAME, {"u": login_data.username}).scalar_one_or_none()
 
     if not user or not verify_password(login_data.password, user.hashed_password):
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
+    # Upgrade legacy bcrypt (or outdated Argon2) hashes now that we have the password
+    if needs_rehash(user.hashed_password):
+        user.hashed_password = hash_password(login_data.password)
+        db.commit()
+
     token = create_jwt_token(user.username, user.role)
     return {"access_token": token, "token_type": "bearer"}
 
@@ -208,64 +308,81 @@ def welcome_legacy(request: Request):
 # ============== SYSTEM ROUTES ==============
 
 @app.get("/health")
-def health_check(request: Request):
+async def health_check(request: Request):
     """Health check endpoint"""
+    if redis_client is not None:
+        # Not autoloaded; cookieless probes never reach Redis and a Redis
+        # outage only makes the session look anonymous
+        await load_session(request)
     session_status = "authenticated" if SessionManager.get_current_user(request) else "anonymous"
-    return {
+    return ORJSONResponse({
         "status": "ok",
         "session_status": session_status,
         "timestamp": time.time()
-    }
+    })
 
 start_time = time.time()
 
+# Parts of /info that never change, built once at startup
+_INFO_STATIC = {
+    "service": "production_user_management_service",
+    "version": "2.0.0",
+    "features": [
+        "session_based_authentication",
+        "oauth2_google_login", 
+        "role_based_access_control",
+        "user_profiles",
+        "admin_panel",
+        "api_endpoints",
+        "csrf_protection"
+    ],
+    "authentication": "session_based"
+}
+
 @app.get("/info")
 def system_info(request: Request, current_user: Optional[dict] = Depends(get_optional_user_session)):
     """System information"""
     uptime = round(time.time() - start_time, 2)
     
-    info = {
-        "service": "production_user_management_service",
-        "version": "2.0.0",
+    # Only the dynamic fields are built per request; ORJSONResponse skips jsonable_encoder
+    return ORJSONResponse({
+        **_INFO_STATIC,
         "uptime_seconds": uptime,
-        "features": [
-            "session_based_authentication",
-            "oauth2_google_login", 
-            "role_based_access_control",
-            "user_profiles",
-            "admin_panel",
-            "api_endpoints",
-            "csrf_protection"
-        ],
-        "authentication": "session_based",
         "session_info": SessionManager.get_session_info(request)
-    }
-    
-    return info
+    })
 
-@app.get("/session/debug")
-def debug_session(request: Request):
-    """Debug session information"""
-    return {
-        "session_data": dict(request.session),
-        "session_info": SessionManager.get_session_info(request),
-        "cookies": dict(request.cookies)
-    }
+# Exposes raw session contents - only registered when DEBUG is set
+if os.getenv("DEBUG"):
+    @app.get("/session/debug")
+    def debug_session(request: Request):
+        """Debug session information"""
+        return ORJSONResponse({
+            "session_data": request.session,  # already a dict, no copy needed
+            "session_info": SessionManager.get_session_info(request),
+            "cookies": request.cookies
+        })
 
 # Error handlers
+def _wants_json(request: Request) -> bool:
+    """JSON errors for API clients: /api/ routes and any JWT (Bearer) request"""
+    return (
+        request.url.path.startswith("/api/")
+        or request.headers.get("authorization", "").lower().startswith("bearer ")
+    )
+
 @app.exception_handler(401)
 async def auth_exception_handler(request: Request, exc: HTTPException):
     """Handle authentication errors"""
-    if request.url.path.startswith("/api/"):
-        return {"detail": exc.detail}
+    if _wants_json(request):
+        return ORJSONResponse({"detail": exc.detail}, status_code=exc.status_code, headers=exc.headers)
     else:
         return RedirectResponse(url="/?error=auth_required", status_code=302)
 
 @app.exception_handler(403)
 async def permission_exception_handler(request: Request, exc: HTTPException):
     """Handle permission errors"""
-    if request.url.path.startswith("/api/"):
-        return {"detail": exc.detail}
+    if _wants_json(request):
+        return ORJSONResponse({"detail": exc.detail}, status_code=exc.status_code, headers=exc.headers)
     else:
         return templates.TemplateResponse("error.html", {
             "request": request,
@@ -2,40 +2,60 @@
 from fastapi import Request, HTTPException
 import redis
 import logging
+import time
+import uuid
 from typing import Optional
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Redis connection settings, shared with the async session store in main.py
+REDIS_HOST = "redis"
+REDIS_PORT = 6379
+REDIS_OPTIONS = {
+    "socket_connect_timeout": 5,
+    "socket_timeout": 5,
+    "retry_on_timeout": True,
+    "health_check_interval": 30
+}
+
 # Connect to Redis with connection pooling and error handling
 try:
-    r = redis.Redis(
-        host="redis", 
-        port=6379, 
-        decode_responses=True,
-        socket_connect_timeout=5,
-        socket_timeout=5,
-        retry_on_timeout=True,
-        health_check_interval=30
-    )
+    r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True, **REDIS_OPTIONS)
     # Test connection
     r.ping()
     logger.info(" Redis connection established")
 except redis.ConnectionError as e:
-    logger.error(f"Redis connection failed: {e}")
+    logger.error("Redis connection failed: %s", e)
     r = None
 
 # Rate limiting configuration
 RATE_LIMIT = 5      # Allow max 5 requests
 WINDOW = 60         # ...within 60 seconds
 
+# Sliding-window log: one sorted set of request timestamps per IP + path.
+# Drops entries older than the window, counts the rest, and records this
+# request only if it is allowed -- all in a single server-side step.
+RATE_LUA = """
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], 0, now - window)
+local n = redis.call('ZCARD', KEYS[1]) + 1
+if n <= tonumber(ARGV[3]) then
+    redis.call('ZADD', KEYS[1], now, ARGV[4])
+    redis.call('EXPIRE', KEYS[1], window)
+end
+return n
+"""
+RATE_SCRIPT = r.register_script(RATE_LUA) if r is not None else None
+
 def get_client_ip(request: Request) -> str:
     """Extract client IP with proper forwarded header handling"""
     # Check for forwarded headers (useful when behind proxy/load balancer)
     forwarded_for = request.headers.get("X-Forwarded-For")
     if forwarded_for:
-        return forwarded_for.split(",")[0].strip()
+        return forwarded_for.partition(",")[0].strip()
     
     real_ip = request.headers.get("X-Real-IP")
     if real_ip:
@@ -44,57 +64,58 @@ def get_client_ip(request: Request) -> str:
     # Fallback to direct client host
     return request.client.host if request.client else "unknown"
 
-async def combined_logger_and_limiter(request: Request, call_next):
+def client_ip(request: Request) -> str:
+    """FastAPI dependency: client IP already resolved by the middleware"""
+    return getattr(request.state, "client_ip", "unknown")
+
+def rate_limit(request: Request) -> None:
+    """FastAPI dependency: sliding-window rate limit for auth routes.
+
+    Attached only to /login, /signup and /login/google, so every other
+    request skips the Redis round-trip entirely.
+    """
+    # Skip rate limiting if Redis is unavailable
+    if r is None:
+        logger.warning("Redis unavailable, skipping rate limiting")
+        return
+    
+    ip = client_ip(request)
+    path = request.url.path
+    try:
+        key = f"ratelog:{ip}:{path}"  # Example: ratelog:127.0.0.1:/login
+        # Requests seen in the last WINDOW seconds, including this one
+        current = RATE_SCRIPT(
+            keys=[key],
+            args=[time.time(), WINDOW, RATE_LIMIT, uuid.uuid4().hex]
+        )
+    except redis.RedisError as e:
+        logger.error("Redis error during rate limiting: %s", e)
+        return  # Continue without rate limiting if Redis fails
+    
+    if current > RATE_LIMIT:
+        logger.warning("Rate limit exceeded for %s on %s", ip, path)
+        raise HTTPException(
+            status_code=429,
+            detail=f"Too Many Requests. Try again in {WINDOW} seconds.",
+            headers={"Retry-After": str(WINDOW)}
+        )
+
+async def request_logger(request: Request, call_next):
     method = request.method
-    url = str(request.url)
+    url = request.url  # stringified lazily by logging
     path = request.url.path
     ip = get_client_ip(request)
+    request.state.client_ip = ip  # Resolve headers once per request
     
     # Log every request
-    logger.info(f" {method} {url} from {ip}")
-    
-    # Apply rate limiting only to login and signup routes
-    if path in ["/login", "/signup", "/login/google"]:
-        # Skip rate limiting if Redis is unavailable
-        if r is None:
-            logger.warning("Redis unavailable, skipping rate limiting")
-        else:
-            try:
-                key = f"rate:{ip}:{path}"  # Example: rate:127.0.0.1:/login
-                current = r.get(key)       # Check how many times this key has been hit
-                
-                if current:
-                    try:
-                        if int(current) >= RATE_LIMIT:
-                            logger.warning(f"Rate limit exceeded for {ip} on {path}")
-                            from fastapi.responses import JSONResponse
-                            return JSONResponse(
-                                status_code=429,
-                                content={
-                                    "detail": f"Too Many Requests. Try again in {WINDOW} seconds.",
-                                    "retry_after": WINDOW
-                                }
-                            )
-                    except ValueError:
-                        logger.error(f"⚠️ Redis has invalid value for key {key}, resetting...")
-                        r.delete(key)  # Clean up invalid key
-                
-                # 🔁 Begin a Redis pipeline (batch multiple operations)
-                pipe = r.pipeline()
-                pipe.incr(key, 1)       # Increase the request count
-                pipe.expire(key, WINDOW)  # Set expiration window (60s)
-                pipe.execute()          # Execute both commands atomically
-                
-            except redis.RedisError as e:
-                logger.error(f"Redis error during rate limiting: {e}")
-                # Continue without rate limiting if Redis fails
+    logger.info(" %s %s from %s", method, url, ip)
     
     # Continue to route or next middleware
     try:
         response = await call_next(request)
         # Log response status
-        logger.info(f"{method} {path} - Status: {response.status_code}")
+        logger.info("%s %s - Status: %s", method, path, response.status_code)
         return response
     except Exception as e:
-        logger.error(f"Error processing request {method} {path}: {e}")
-        raise
\ No newline at end of file
+        logger.error("Error processing request %s %s: %s", method, path, e)
+        raise
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import Column, Integer, String, bindparam, select
 from sqlalchemy.orm import relationship
 from database import Base
 
@@ -6,9 +6,12 @@ class User(Base):
     __tablename__ = "users"
     
     id = Column(Integer, primary_key=True, index=True)
-    username = Column(String, unique=True, index=True)
+    username = Column(String, unique=True, index=True, nullable=False)
     hashed_password = Column(String)
     role = Column(String, default="user")  # 'admin' or 'user'
     
     # ADD THIS LINE - Relationship to profile
-    profile = relationship("UserProfile", back_populates="user", uselist=False)
\ No newline at end of file
+    profile = relationship("UserProfile", back_populates="user", uselist=False)
+
+# Prebuilt lookup statement, reused by every login/signup instead of building a Query
+USER_BY_USERNAME = select(User).where(User.username == bindparam("u"))
@@ -5,8 +5,13 @@ from starlette.config import Config
 from starlette.responses import RedirectResponse, HTMLResponse
 from sqlalchemy.orm import Session
 from database import SessionLocal
-from models import User
-from session_manager import SessionManager  # Import our session manager
+from models import User, USER_BY_USERNAME
+from session_manager import SessionManager, store_oauth_profile  # Import our session manager
+from cache_utils import drop_cached, USERS_CACHE_KEY
+from middlewares import rate_limit
+import logging
+
+logger = logging.getLogger(__name__)
 
 # Step 1: Load .env automatically from root
 config = Config(".env")
@@ -38,6 +43,20 @@ else:
         }
     )
 
+# Warm authlib's caches so the first Google login doesn't pay for the
+# discovery document and JWKS downloads (both are kept on the client).
+# Called from the app's lifespan in main.py.
+async def prefetch_google_metadata():
+    if not oauth:
+        return
+    try:
+        await oauth.google.load_server_metadata()
+        await oauth.google.fetch_jwk_set()
+        logger.info("Google OAuth metadata and JWKS prefetched")
+    except Exception as e:
+        # Not fatal - authlib will fetch lazily on the first login instead
+        logger.warning("Could not prefetch Google OAuth metadata: %s", e)
+
 # Step 5: Dependency to get database session
 def get_db():
     db = SessionLocal()
@@ -47,7 +66,7 @@ def get_db():
         db.close()
 
 # Step 6: OAuth login route
-@router.get("/login/google")
+@router.get("/login/google", dependencies=[Depends(rate_limit)])
 async def login_via_google(request: Request):
     if not oauth:
         return HTMLResponse(
@@ -104,7 +123,7 @@ async def auth_callback(request: Request, db: Session = Depends(get_db)):
             raise Exception("Email not returned by Google")
 
         # Find or create user in database
-        existing_user = db.query(User).filter(User.username == user_info['email']).first()
+        existing_user = db.execute(USER_BY_USERNAME, {"u": user_info['email']}).scalar_one_or_none()
         if not existing_user:
             new_user = User(
                 username=user_info['email'],
@@ -113,8 +132,8 @@ async def auth_callback(request: Request, db: Session = Depends(get_db)):
             )
             db.add(new_user)
             db.commit()
-            db.refresh(new_user)
             existing_user = new_user
+            drop_cached(USERS_CACHE_KEY)  # New user must show up in /users
             print(f"DEBUG: Created new user: {user_info['email']}")
 
         # CREATE SESSION (This is the key change!)
@@ -122,14 +141,18 @@ async def auth_callback(request: Request, db: Session = Depends(get_db)):
             "user_id": existing_user.id,
             "username": existing_user.username,
             "email": user_info['email'],
-            "role": existing_user.role,
-            "display_name": user_info.get('name', user_info.get('email', 'User')),
-            "google_info": {
-                "name": user_info.get('name'),
-                "picture": user_info.get('picture'),
-                "google_id": user_info.get('sub')
-            }
+            "role": existing_user.role
+        }
+        google_info = {
+            "name": user_info.get('name'),
+            "picture": user_info.get('picture'),
+            "google_id": user_info.get('sub')
         }
+        # The short display name stays in the session (read on every page);
+        # the rest of the Google profile goes to Redis when available
+        session_data["display_name"] = user_info.get('name', user_info.get('email', 'User'))
+        if not store_oauth_profile(existing_user.id, google_info):
+            session_data["google_info"] = google_info
         
         SessionManager.create_user_session(request, session_data)
         
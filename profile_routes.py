@@ -1,29 +1,128 @@
 # profile_routes.py (Production with Session Management)
-from fastapi import APIRouter, Depends, HTTPException, Request, Form
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from fastapi.responses import HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
+from jinja2 import Environment, FileSystemLoader, TemplateNotFound
+from sqlalchemy import bindparam, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only, selectinload
+from pydantic import ValidationError
+from typing import List, Optional
+import hashlib
+import logging
 
-from database import SessionLocal
-from session_manager import get_current_user_session, get_admin_user_session
+from database import AsyncSessionLocal
+from session_manager import SessionManager
+from session_dependencies import get_current_user_session, get_admin_user_session
 from jwt_utils import get_current_user  # Still used for API endpoints
 from profile_models import UserProfile
-from profile_schemas import ProfileCreate, ProfileResponse
+from profile_schemas import ProfileCreate, ProfileBulkCreate, ProfileResponse, profile_form_fields, form_error_message
 from models import User
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/profile", tags=["User Profile"])
-templates = Jinja2Templates(directory="templates")
+# Templates don't change at runtime: skip per-request mtime checks and keep them all compiled.
+# cache_size can only be set when the Environment is created, so build it ourselves.
+templates = Jinja2Templates(env=Environment(
+    loader=FileSystemLoader("templates"),
+    autoescape=True,
+    auto_reload=False,
+    cache_size=400
+))
+
+PROFILE_TEMPLATES = (
+    "create_profile.html",
+    "my_profile.html",
+    "edit_profile.html",
+    "profile_success.html",
+    "no_profile.html",
+    "admin_profiles.html",
+)
 
-# Database dependency
-def get_db():
-    db = SessionLocal()
+# Compile every profile template at startup instead of on first request
+for _name in PROFILE_TEMPLATES:
     try:
+        templates.get_template(_name)
+    except TemplateNotFound:
+        logger.warning("Profile template %s is missing", _name)
+
+# Database dependency (async: DB waits don't tie up a threadpool worker)
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+# A user and their profile (None if they have none) in a single query
+USER_WITH_PROFILE = (
+    select(User, UserProfile)
+    .outerjoin(UserProfile, UserProfile.user_id == User.id)
+    .where(User.username == bindparam("u"))
+)
+
+async def get_user_and_profile(db: AsyncSession, username: str):
+    """Return (user, profile) for a username; (None, None) if the user doesn't exist"""
+    row = (await db.execute(USER_WITH_PROFILE, {"u": username})).first()
+    return (row[0], row[1]) if row else (None, None)
+
+PROFILE_BY_USER_ID = select(UserProfile).where(UserProfile.user_id == bindparam("uid"))
+
+async def get_profile(db: AsyncSession, user_id: int):
+    """Return the profile for a user id, or None"""
+    return await db.scalar(PROFILE_BY_USER_ID, {"uid": user_id})
+
+# Just the columns that identify a profile version (for ETag checks)
+PROFILE_VERSION_BY_USERNAME = (
+    select(UserProfile.id, UserProfile.updated_at)
+    .join(User, User.id == UserProfile.user_id)
+    .where(User.username == bindparam("u"))
+)
+PROFILE_VERSION_BY_USER_ID = (
+    select(UserProfile.id, UserProfile.updated_at)
+    .where(UserProfile.user_id == bindparam("uid"))
+)
+
+def profile_etag(profile_id: int, updated_at) -> str:
+    """Quoted ETag for a profile version; changes whenever updated_at does"""
+    stamp = updated_at.timestamp() if updated_at else ""
+    return '"%s"' % hashlib.blake2b(f"{profile_id}:{stamp}".encode(), digest_size=8).hexdigest()
+
+async def not_modified(db: AsyncSession, if_none_match: Optional[str], stmt, params: dict) -> Optional[Response]:
+    """Return a 304 response if the client's cached profile is still current.
+
+    Only the id/updated_at columns are read; the full row is fetched by the
+    caller on a miss.
+    """
+    if not if_none_match:
+        return None
+    row = (await db.execute(stmt, params)).first()
+    if row is None:
+        return None
+    etag = profile_etag(row[0], row[1])
+    if etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers={"ETag": etag})
+    return None
+
+# One INSERT ... ON CONFLICT DO NOTHING RETURNING instead of SELECT-then-INSERT;
+# the unique user_id constraint decides whether a profile already exists
+async def insert_profile(db: AsyncSession, user_id: int, **fields):
+    """Create a profile; returns None if the user already has one"""
+    stmt = (
+        sqlite_insert(UserProfile)
+        .values(user_id=user_id, **fields)
+        .on_conflict_do_nothing(index_elements=["user_id"])
+        .returning(UserProfile)
+    )
+    profile = (await db.scalars(stmt)).first()
+    await db.commit()
+    return profile
 
 # ============== HTML ROUTES (Session-based) ==============
 
+def _base_ctx(request: Request, current_user: dict, **extra) -> dict:
+    """Template context shared by the session-authenticated profile pages"""
+    return {"request": request, "current_user": current_user, "username": current_user["username"], **extra}
+
 @router.get("/create", response_class=HTMLResponse)
 def show_create_profile_form(
     request: Request, 
@@ -31,22 +130,17 @@ def show_create_profile_form(
 ):
     """Show create profile form - Production session authentication"""
     
-    return templates.TemplateResponse("create_profile.html", {
-        "request": request,
-        "username": current_user["username"],
-        "user_id": current_user["user_id"],
-        "display_name": current_user.get("display_name", current_user["username"])
-    })
+    return templates.TemplateResponse("create_profile.html", _base_ctx(
+        request, current_user,
+        user_id=current_user["user_id"],
+        display_name=SessionManager.get_display_name(current_user)
+    ))
 
 @router.post("/create", response_class=HTMLResponse)
-def create_profile_form(
+async def create_profile_form(
     request: Request,
-    first_name: str = Form(...),
-    last_name: str = Form(...),
-    email: str = Form(...),
-    phone: str = Form(""),
-    bio: str = Form(""),
-    db: Session = Depends(get_db),
+    form: dict = Depends(profile_form_fields),
+    db: AsyncSession = Depends(get_db),
     current_user: dict = Depends(get_current_user_session)
 ):
     """Create profile from HTML form - Production version"""
@@ -54,174 +148,159 @@ def create_profile_form(
     user_id = current_user["user_id"]
     username = current_user["username"]
     
-    print(f"DEBUG: Creating profile for user_id: {user_id}, username: {username}")
-    
-    # Check if profile already exists
-    existing_profile = db.query(UserProfile).filter(UserProfile.user_id == user_id).first()
-    if existing_profile:
-        print(f"DEBUG: Profile already exists for user {user_id}")
-        return templates.TemplateResponse("my_profile.html", {
-            "request": request,
-            "username": username,
-            "profile": existing_profile,
-            "current_user": current_user
-        })
+    logger.debug("Creating profile for user_id=%s username=%s", user_id, username)
     
     try:
-        # Create new profile
-        profile = UserProfile(
-            user_id=user_id,
-            first_name=first_name,
-            last_name=last_name,
-            email=email,
-            phone=phone if phone else None,
-            bio=bio if bio else None
+        data = ProfileCreate(**form)
+        
+        # Create new profile (no-op if one already exists)
+        profile = await insert_profile(
+            db,
+            user_id,
+            first_name=data.first_name,
+            last_name=data.last_name,
+            email=data.email,
+            phone=data.phone or None,
+            bio=data.bio or None
         )
         
-        db.add(profile)
-        db.commit()
-        db.refresh(profile)
+        if profile is None:
+            logger.debug("Profile already exists for user %s", user_id)
+            existing_profile = await get_profile(db, user_id)
+            return templates.TemplateResponse("my_profile.html", _base_ctx(request, current_user, profile=existing_profile))
         
-        print(f"DEBUG: Successfully created profile for user {user_id}")
+        logger.debug("Successfully created profile for user %s", user_id)
         
-        return templates.TemplateResponse("profile_success.html", {
-            "request": request,
-            "message": "Profile created successfully!",
-            "profile": profile,
-            "current_user": current_user
-        })
+        return templates.TemplateResponse("profile_success.html", _base_ctx(
+            request, current_user, message="Profile created successfully!", profile=profile
+        ))
         
+    except ValidationError as e:
+        return templates.TemplateResponse("create_profile.html", _base_ctx(
+            request, current_user, error=form_error_message(e)
+        ))
     except Exception as e:
-        print(f"DEBUG: Error creating profile: {str(e)}")
-        return templates.TemplateResponse("create_profile.html", {
-            "request": request,
-            "username": username,
-            "current_user": current_user,
-            "error": f"Error creating profile: {str(e)}"
-        })
+        logger.error("Error creating profile for user %s: %s", user_id, e)
+        return templates.TemplateResponse("create_profile.html", _base_ctx(
+            request, current_user, error=f"Error creating profile: {str(e)}"
+        ))
 
 @router.get("/me", response_class=HTMLResponse)
-def get_my_profile_page(
+async def get_my_profile_page(
     request: Request, 
     current_user: dict = Depends(get_current_user_session),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Get current user's profile page - Production session auth"""
     
     user_id = current_user["user_id"]
-    username = current_user["username"]
-    
-    profile = db.query(UserProfile).filter(UserProfile.user_id == user_id).first()
+    profile = await get_profile(db, user_id)
     
     if not profile:
-        return templates.TemplateResponse("no_profile.html", {
-            "request": request,
-            "username": username,
-            "current_user": current_user
-        })
+        return templates.TemplateResponse("no_profile.html", _base_ctx(request, current_user))
     
-    return templates.TemplateResponse("my_profile.html", {
-        "request": request,
-        "username": username,
-        "profile": profile,
-        "current_user": current_user
-    })
+    return templates.TemplateResponse("my_profile.html", _base_ctx(request, current_user, profile=profile))
 
 @router.get("/edit", response_class=HTMLResponse)
-def edit_profile_form(
+async def edit_profile_form(
     request: Request,
     current_user: dict = Depends(get_current_user_session),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Show edit profile form"""
     
     user_id = current_user["user_id"]
-    profile = db.query(UserProfile).filter(UserProfile.user_id == user_id).first()
+    profile = await get_profile(db, user_id)
     
     if not profile:
         return RedirectResponse(url="/profile/create", status_code=302)
     
-    return templates.TemplateResponse("edit_profile.html", {
-        "request": request,
-        "username": current_user["username"],
-        "profile": profile,
-        "current_user": current_user
-    })
+    return templates.TemplateResponse("edit_profile.html", _base_ctx(request, current_user, profile=profile))
 
 @router.post("/edit", response_class=HTMLResponse)
-def update_profile_form(
+async def update_profile_form(
     request: Request,
-    first_name: str = Form(...),
-    last_name: str = Form(...),
-    email: str = Form(...),
-    phone: str = Form(""),
-    bio: str = Form(""),
-    db: Session = Depends(get_db),
+    form: dict = Depends(profile_form_fields),
+    db: AsyncSession = Depends(get_db),
     current_user: dict = Depends(get_current_user_session)
 ):
     """Update profile from HTML form"""
     
     user_id = current_user["user_id"]
-    profile = db.query(UserProfile).filter(UserProfile.user_id == user_id).first()
+    profile = await get_profile(db, user_id)
     
     if not profile:
         return RedirectResponse(url="/profile/create", status_code=302)
     
     try:
+        data = ProfileCreate(**form)
+        
         # Update profile
-        profile.first_name = first_name
-        profile.last_name = last_name
-        profile.email = email
-        profile.phone = phone if phone else None
-        profile.bio = bio if bio else None
+        profile.first_name = data.first_name
+        profile.last_name = data.last_name
+        profile.email = data.email
+        profile.phone = data.phone or None
+        profile.bio = data.bio or None
         
-        db.commit()
-        db.refresh(profile)
+        await db.commit()
         
-        return templates.TemplateResponse("profile_success.html", {
-            "request": request,
-            "message": "Profile updated successfully!",
-            "profile": profile,
-            "current_user": current_user
-        })
+        return templates.TemplateResponse("profile_success.html", _base_ctx(
+            request, current_user, message="Profile updated successfully!", profile=profile
+        ))
         
+    except ValidationError as e:
+        return templates.TemplateResponse("edit_profile.html", _base_ctx(
+            request, current_user, profile=profile, error=form_error_message(e)
+        ))
     except Exception as e:
-        return templates.TemplateResponse("edit_profile.html", {
-            "request": request,
-            "username": current_user["username"],
-            "profile": profile,
-            "current_user": current_user,
-            "error": f"Error updating profile: {str(e)}"
-        })
+        return templates.TemplateResponse("edit_profile.html", _base_ctx(
+            request, current_user, profile=profile, error=f"Error updating profile: {str(e)}"
+        ))
 
 @router.post("/delete", response_class=HTMLResponse)
-def delete_profile(
+async def delete_profile(
     request: Request,
     current_user: dict = Depends(get_current_user_session),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Delete user profile"""
     
     user_id = current_user["user_id"]
-    profile = db.query(UserProfile).filter(UserProfile.user_id == user_id).first()
+    profile = await get_profile(db, user_id)
     
     if profile:
-        db.delete(profile)
-        db.commit()
+        await db.delete(profile)
+        await db.commit()
     
     return RedirectResponse(url="/dashboard?message=profile_deleted", status_code=302)
 
 # ============== ADMIN ROUTES ==============
 
 @router.get("/all", response_class=HTMLResponse)
-def list_all_profiles(
+async def list_all_profiles(
     request: Request,
     admin_user: dict = Depends(get_admin_user_session),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """List all profiles - Admin only"""
     
-    profiles = db.query(UserProfile).join(User).all()
+    # Listing columns only (no bio TEXT); users are batch-loaded in one extra
+    # SELECT ... IN query instead of one per row in the template
+    # NOTE: under AsyncSession an unloaded column can't lazy-load - reading it
+    # (e.g. profile.bio, phone, updated_at) raises MissingGreenlet. The admin
+    # listing template may only use the columns below and user.username;
+    # add a column here before using it in the template.
+    profiles = (await db.scalars(select(UserProfile).options(
+        load_only(
+            UserProfile.id,
+            UserProfile.user_id,
+            UserProfile.first_name,
+            UserProfile.last_name,
+            UserProfile.email,
+            UserProfile.created_at
+        ),
+        selectinload(UserProfile.user).load_only(User.username)
+    ))).all()
     
     return templates.TemplateResponse("admin_profiles.html", {
         "request": request,
@@ -232,107 +311,173 @@ def list_all_profiles(
 # ============== API ROUTES (JWT-based for external clients) ==============
 
 @router.post("/", response_model=ProfileResponse)
-def create_profile_api(
+async def create_profile_api(
     profile_data: ProfileCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: dict = Depends(get_current_user)  # JWT-based for API
 ):
     """Create profile via API - Requires JWT token"""
     
-    user = db.query(User).filter(User.username == current_user["username"]).first()
+    user, existing_profile = await get_user_and_profile(db, current_user["username"])
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
     # Check if profile already exists
-    existing_profile = db.query(UserProfile).filter(UserProfile.user_id == user.id).first()
     if existing_profile:
         raise HTTPException(status_code=400, detail="Profile already exists for this user")
     
-    # Create new profile
-    profile = UserProfile(
-        user_id=user.id,
-        **profile_data.dict(exclude_unset=True)
-    )
-    
-    db.add(profile)
-    db.commit()
-    db.refresh(profile)
+    # Create new profile (ON CONFLICT still guards against a concurrent create)
+    profile = await insert_profile(db, user.id, **profile_data.model_dump(exclude_unset=True))
+    if profile is None:
+        raise HTTPException(status_code=400, detail="Profile already exists for this user")
     return profile
 
+# Rows per multi-row INSERT (keeps each statement under the bind-parameter limit)
+BULK_INSERT_CHUNK = 1000
+
+@router.post("/bulk")
+async def bulk_create_profiles_api(
+    profiles: List[ProfileBulkCreate],
+    db: AsyncSession = Depends(get_db),
+    current_user: dict = Depends(get_current_user)  # JWT-based for API
+):
+    """Create many profiles at once - Requires admin JWT token"""
+    
+    if current_user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Access denied. Admin role required.")
+    
+    # Resolve every username in one query
+    usernames = {p.username for p in profiles}
+    user_ids = dict((await db.execute(
+        select(User.username, User.id).where(User.username.in_(usernames))
+    )).all())
+    existing = set(await db.scalars(
+        select(UserProfile.user_id).where(UserProfile.user_id.in_(user_ids.values()))
+    ))
+    
+    rows, missing_users, already_exists = [], [], []
+    for p in profiles:
+        user_id = user_ids.get(p.username)
+        if user_id is None:
+            missing_users.append(p.username)
+        elif user_id in existing:
+            already_exists.append(p.username)
+        else:
+            existing.add(user_id)  # Also catches duplicates within this request
+            rows.append({"user_id": user_id, **p.model_dump(exclude={"username"})})
+    
+    # Batched executemany instead of one INSERT + commit per profile. ON CONFLICT
+    # covers profiles created concurrently since the SELECT above; RETURNING
+    # tells us which rows actually went in
+    stmt = (
+        sqlite_insert(UserProfile)
+        .on_conflict_do_nothing(index_elements=["user_id"])
+        .returning(UserProfile.user_id)
+    )
+    created = set()
+    for i in range(0, len(rows), BULK_INSERT_CHUNK):
+        created.update(await db.scalars(stmt, rows[i:i + BULK_INSERT_CHUNK]))
+    await db.commit()
+    
+    usernames_by_id = {user_id: username for username, user_id in user_ids.items()}
+    already_exists.extend(usernames_by_id[row["user_id"]] for row in rows if row["user_id"] not in created)
+    
+    return {
+        "created": len(created),
+        "missing_users": missing_users,
+        "already_exists": already_exists
+    }
+
 @router.get("/me/api", response_model=ProfileResponse)
-def get_my_profile_api(
-    db: Session = Depends(get_db),
+async def get_my_profile_api(
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
     current_user: dict = Depends(get_current_user)  # JWT-based for API
 ):
     """Get profile data via API - Requires JWT token"""
     
-    user = db.query(User).filter(User.username == current_user["username"]).first()
+    cached = await not_modified(
+        db, request.headers.get("if-none-match"),
+        PROFILE_VERSION_BY_USERNAME, {"u": current_user["username"]}
+    )
+    if cached:
+        return cached
+    
+    user, profile = await get_user_and_profile(db, current_user["username"])
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    profile = db.query(UserProfile).filter(UserProfile.user_id == user.id).first()
     if not profile:
         raise HTTPException(status_code=404, detail="Profile not found")
     
+    response.headers["ETag"] = profile_etag(profile.id, profile.updated_at)
     return profile
 
 @router.put("/me/api", response_model=ProfileResponse)
-def update_profile_api(
+async def update_profile_api(
     profile_data: ProfileCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: dict = Depends(get_current_user)  # JWT-based for API
 ):
     """Update profile via API - Requires JWT token"""
     
-    user = db.query(User).filter(User.username == current_user["username"]).first()
+    user, profile = await get_user_and_profile(db, current_user["username"])
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    profile = db.query(UserProfile).filter(UserProfile.user_id == user.id).first()
     if not profile:
         raise HTTPException(status_code=404, detail="Profile not found")
     
     # Update profile fields
-    update_data = profile_data.dict(exclude_unset=True)
+    update_data = profile_data.model_dump(exclude_unset=True)
     for field, value in update_data.items():
         setattr(profile, field, value)
     
-    db.commit()
-    db.refresh(profile)
+    await db.commit()
     return profile
 
 @router.delete("/me/api")
-def delete_profile_api(
-    db: Session = Depends(get_db),
+async def delete_profile_api(
+    db: AsyncSession = Depends(get_db),
     current_user: dict = Depends(get_current_user)  # JWT-based for API
 ):
     """Delete profile via API - Requires JWT token"""
     
-    user = db.query(User).filter(User.username == current_user["username"]).first()
+    user, profile = await get_user_and_profile(db, current_user["username"])
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    profile = db.query(UserProfile).filter(UserProfile.user_id == user.id).first()
     if not profile:
         raise HTTPException(status_code=404, detail="Profile not found")
     
-    db.delete(profile)
-    db.commit()
+    await db.delete(profile)
+    await db.commit()
     return {"message": "Profile deleted successfully"}
 
 # ============== SESSION-BASED API ROUTES (Alternative) ==============
 
 @router.get("/me/session", response_model=ProfileResponse)
-def get_profile_session_api(
+async def get_profile_session_api(
+    request: Request,
+    response: Response,
     current_user: dict = Depends(get_current_user_session),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Get profile via session authentication - Alternative API"""
     
     user_id = current_user["user_id"]
-    profile = db.query(UserProfile).filter(UserProfile.user_id == user_id).first()
+    cached = await not_modified(
+        db, request.headers.get("if-none-match"),
+        PROFILE_VERSION_BY_USER_ID, {"uid": user_id}
+    )
+    if cached:
+        return cached
+    
+    profile = await get_profile(db, user_id)
     
     if not profile:
         raise HTTPException(status_code=404, detail="Profile not found")
     
+    response.headers["ETag"] = profile_etag(profile.id, profile.updated_at)
     return profile
\ No newline at end of file
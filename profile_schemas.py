@@ -1,10 +1,13 @@
     # profile_schemas.py (Simple Phase 1)
-from pydantic import BaseModel, EmailStr, validator
-from typing import Optional
+from fastapi import Form
+from pydantic import BaseModel, ConfigDict, EmailStr, ValidationError, field_validator
+from typing import Dict, Optional
 from datetime import datetime
 
 class ProfileCreate(BaseModel):
     """Schema for creating a new profile"""
+    model_config = ConfigDict(str_strip_whitespace=True)
+    
     first_name: Optional[str] = None
     last_name: Optional[str] = None
     email: Optional[EmailStr] = None
@@ -12,18 +15,24 @@ class ProfileCreate(BaseModel):
     bio: Optional[str] = None
     
     # Simple validation
-    @validator('phone')
+    @field_validator('phone')
+    @classmethod
     def validate_phone(cls, v):
         if v and len(v) < 10:
             raise ValueError('Phone number must be at least 10 characters')
         return v
     
-    @validator('bio')
+    @field_validator('bio')
+    @classmethod
     def validate_bio(cls, v):
         if v and len(v) > 200:
             raise ValueError('Bio must be less than 200 characters')
         return v
 
+class ProfileBulkCreate(ProfileCreate):
+    """Schema for one entry of a bulk profile create"""
+    username: str
+
 class ProfileResponse(BaseModel):
     """Schema for profile responses"""
     id: int
@@ -35,5 +44,24 @@ class ProfileResponse(BaseModel):
     bio: Optional[str] = None
     created_at: datetime
     
-    class Config:
-        from_attributes = True
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+
+def profile_form_fields(
+    first_name: str = Form(...),
+    last_name: str = Form(...),
+    email: str = Form(...),
+    phone: str = Form(""),
+    bio: str = Form("")
+) -> Dict[str, str]:
+    """FastAPI dependency: collect the profile HTML form fields.
+
+    Routes validate them with ProfileCreate(**form) so they can re-render the
+    form with an error instead of returning a JSON 422.
+    """
+    return {"first_name": first_name, "last_name": last_name, "email": email, "phone": phone, "bio": bio}
+
+def form_error_message(e: ValidationError) -> str:
+    """Readable summary of a ValidationError for HTML forms"""
+    return "; ".join(
+        f"{err['loc'][-1]}: {err['msg'].removeprefix('Value error, ')}" for err in e.errors()
+    )
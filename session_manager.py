@@ -1,135 +1,239 @@
 # session_manager.py
 from fastapi import Request, HTTPException
 from starlette.middleware.sessions import SessionMiddleware
+from starsessions.serializers import Serializer
+from starsessions.stores.redis import RedisStore
 from typing import Optional, Dict, Any
 import json
-from datetime import datetime, timedelta
+import logging
+import orjson
+import redis
+from collections import deque
+from datetime import datetime
+import base64
 import secrets
+import time
 
-class SessionManager:
-    """Production-grade session management"""
+from middlewares import r
+
+logger = logging.getLogger(__name__)
+
+# Google profile data (name, picture, id) lives in Redis, not in the session.
+# It is informational only: nothing on the request path reads it, so it may
+# expire before a long-lived (rolling) session does.
+OAUTH_PROFILE_TTL = 86400  # 24 hours
+
+def store_oauth_profile(user_id: int, profile: Dict[str, Any]) -> bool:
+    """Save OAuth profile fields to profile:<user_id>; False if Redis is unavailable"""
+    if r is None:
+        return False
+    key = f"profile:{user_id}"
+    try:
+        pipe = r.pipeline()
+        pipe.delete(key)
+        pipe.hset(key, mapping={k: v for k, v in profile.items() if v is not None})
+        pipe.expire(key, OAUTH_PROFILE_TTL)
+        pipe.execute()
+        return True
+    except redis.RedisError as e:
+        logger.error("Redis error storing OAuth profile %s: %s", key, e)
+        return False
+
+def get_oauth_profile(user_id: int) -> Dict[str, str]:
+    """Load OAuth profile fields for a user (empty dict if none / Redis unavailable)"""
+    if r is None:
+        return {}
+    try:
+        return r.hgetall(f"profile:{user_id}")
+    except redis.RedisError as e:
+        logger.error("Redis error reading OAuth profile for user %s: %s", user_id, e)
+        return {}
+
+class OrjsonSessionSerializer(Serializer):
+    """Serialize server-side session payloads with orjson"""
     
-    @staticmethod
-    def create_user_session(request: Request, user_data: Dict[str, Any]) -> None:
-        """Create a new user session"""
-        session_data = {
-            "user_id": user_data.get("user_id"),
-            "username": user_data.get("username"),
-            "email": user_data.get("email"),
-            "role": user_data.get("role", "user"),
-            "login_time": datetime.utcnow().isoformat(),
-            "last_activity": datetime.utcnow().isoformat(),
-            "authenticated": True,
-            "display_name": user_data.get("display_name"),
-            "google_info": user_data.get("google_info", {})
-        }
-        
-        # Store in session (encrypted by SessionMiddleware)
-        request.session.update(session_data)
-        request.session["csrf_token"] = SessionManager._generate_csrf_token()
+    def serialize(self, data: Any) -> bytes:
+        return orjson.dumps(data)
     
-    @staticmethod
-    def get_current_user(request: Request) -> Optional[Dict[str, Any]]:
-        """Get current user from session"""
-        if not request.session.get("authenticated"):
-            return None
-        
-        # Update last activity
-        request.session["last_activity"] = datetime.utcnow().isoformat()
-        
-        # Check session expiry (optional)
-        if SessionManager._is_session_expired(request):
-            SessionManager.clear_session(request)
-            return None
-        
-        return {
-            "user_id": request.session.get("user_id"),
-            "username": request.session.get("username"),
-            "email": request.session.get("email"),
-            "role": request.session.get("role"),
-            "login_time": request.session.get("login_time"),
-            "csrf_token": request.session.get("csrf_token"),
-            "display_name": request.session.get("display_name"),
-            "google_info": request.session.get("google_info", {})
-        }
+    def deserialize(self, data: bytes) -> Dict[str, Any]:
+        return orjson.loads(data)
+
+class FailSoftRedisStore(RedisStore):
+    """RedisStore that treats Redis errors as "no session" instead of failing the request"""
     
-    @staticmethod
-    def update_session(request: Request, updates: Dict[str, Any]) -> None:
-        """Update session data"""
-        if request.session.get("authenticated"):
-            request.session.update(updates)
-            request.session["last_activity"] = datetime.utcnow().isoformat()
+    async def read(self, session_id: str, *args, **kwargs) -> bytes:
+        try:
+            return await super().read(session_id, *args, **kwargs)
+        except redis.RedisError as e:
+            logger.error("Redis error reading session: %s", e)
+            return b""
     
-    @staticmethod
-    def clear_session(request: Request) -> None:
-        """Clear user session (logout)"""
-        request.session.clear()
+    async def write(self, session_id: str, *args, **kwargs) -> str:
+        try:
+            return await super().write(session_id, *args, **kwargs)
+        except redis.RedisError as e:
+            logger.error("Redis error writing session: %s", e)
+            return session_id
     
-    @staticmethod
-    def require_auth(request: Request) -> Dict[str, Any]:
-        """Require authentication - raises exception if not logged in"""
-        user = SessionManager.get_current_user(request)
-        if not user:
-            raise HTTPException(
-                status_code=401, 
-                detail="Authentication required. Please login first."
-            )
-        return user
+    async def remove(self, session_id: str) -> None:
+        try:
+            await super().remove(session_id)
+        except redis.RedisError as e:
+            logger.error("Redis error removing session: %s", e)
+
+# Session helpers are plain module functions: dependencies call them directly
+# instead of going through SessionManager attribute lookups on every request.
+_utcnow = datetime.utcnow
+_time = time.time
+
+# last_activity is rewritten at most this often (seconds), so request
+# bursts from one user don't keep rewriting the session
+ACTIVITY_WRITE_INTERVAL = 60
+
+# request.state.session_user holds the user resolved for this request;
+# _UNRESOLVED means "not looked up yet" (None means "not logged in")
+_UNRESOLVED = object()
+
+def _create_user_session(request: Request, user_data: Dict[str, Any]) -> None:
+    """Create a new user session"""
+    session_data = {
+        "user_id": user_data.get("user_id"),
+        "username": user_data.get("username"),
+        "email": user_data.get("email"),
+        "role": user_data.get("role", "user"),
+        "login_time": _utcnow().isoformat(),
+        "last_activity": int(_time()),  # unix timestamp
+        "authenticated": True,
+        "display_name": user_data.get("display_name"),
+        "google_info": user_data.get("google_info", {})
+    }
     
-    @staticmethod
-    def require_role(request: Request, required_role: str) -> Dict[str, Any]:
-        """Require specific role"""
-        user = SessionManager.require_auth(request)
-        if user["role"] != required_role:
-            raise HTTPException(
-                status_code=403,
-                detail=f"Access denied. {required_role.title()} role required."
-            )
-        return user
+    # Store in session (encrypted by SessionMiddleware)
+    request.session.update(session_data)
+    request.session["csrf_token"] = _generate_csrf_token()
+    request.state.session_user = _UNRESOLVED
+
+def _get_current_user(request: Request) -> Optional[Dict[str, Any]]:
+    """Get current user from session (resolved once per request)"""
+    user = getattr(request.state, "session_user", _UNRESOLVED)
+    if user is _UNRESOLVED:
+        user = _load_current_user(request)
+        request.state.session_user = user
+    return user
+
+def _load_current_user(request: Request) -> Optional[Dict[str, Any]]:
+    """Build the current user dict from the session"""
+    s = request.session
+    if not s.get("authenticated"):
+        return None
+    
+    # Check session expiry (optional)
+    if _is_session_expired(request):
+        _clear_session(request)
+        return None
     
-    @staticmethod
-    def _generate_csrf_token() -> str:
-        """Generate CSRF token"""
-        return secrets.token_urlsafe(32)
+    # Update last activity (throttled)
+    now = int(_time())
+    if now - s["last_activity"] >= ACTIVITY_WRITE_INTERVAL:
+        s["last_activity"] = now
     
-    @staticmethod
-    def _is_session_expired(request: Request, max_age_hours: int = 24) -> bool:
-        """Check if session is expired"""
-        last_activity = request.session.get("last_activity")
-        if not last_activity:
-            return True
-        
+    return {
+        "user_id": s.get("user_id"),
+        "username": s.get("username"),
+        "email": s.get("email"),
+        "role": s.get("role"),
+        "login_time": s.get("login_time"),
+        "csrf_token": s.get("csrf_token"),
+        "display_name": s.get("display_name"),
+        "google_info": s.get("google_info", {})
+    }
+
+def _get_display_name(user: Dict[str, Any]) -> str:
+    """Display name for a session user (no Redis lookup: it lives in the session)"""
+    return user.get("display_name") or user["username"]
+
+def _update_session(request: Request, updates: Dict[str, Any]) -> None:
+    """Update session data"""
+    if request.session.get("authenticated"):
+        request.session.update(updates)
+        request.session["last_activity"] = int(_time())
+        request.state.session_user = _UNRESOLVED
+
+def _clear_session(request: Request) -> None:
+    """Clear user session (logout)"""
+    request.session.clear()
+    request.state.session_user = None
+
+def _require_auth(request: Request) -> Dict[str, Any]:
+    """Require authentication - raises exception if not logged in"""
+    user = _get_current_user(request)
+    if not user:
+        raise HTTPException(
+            status_code=401, 
+            detail="Authentication required. Please login first."
+        )
+    return user
+
+def _require_role(request: Request, required_role: str) -> Dict[str, Any]:
+    """Require specific role"""
+    user = _require_auth(request)
+    if user["role"] != required_role:
+        raise HTTPException(
+            status_code=403,
+            detail=f"Access denied. {required_role.title()} role required."
+        )
+    return user
+
+# CSRF tokens are cut from one large urandom read, CSRF_TOKEN_BATCH at a time
+CSRF_TOKEN_BYTES = 32
+CSRF_TOKEN_BATCH = 64
+_csrf_token_pool = deque()
+
+def _generate_csrf_token() -> str:
+    """Generate CSRF token (same 32 bytes of entropy as secrets.token_urlsafe(32))"""
+    while True:
         try:
-            last_time = datetime.fromisoformat(last_activity)
-            expire_time = last_time + timedelta(hours=max_age_hours)
-            return datetime.utcnow() > expire_time
-        except:
-            return True
+            return _csrf_token_pool.popleft()
+        except IndexError:
+            raw = secrets.token_bytes(CSRF_TOKEN_BYTES * CSRF_TOKEN_BATCH)
+            _csrf_token_pool.extend(
+                base64.urlsafe_b64encode(raw[i:i + CSRF_TOKEN_BYTES]).rstrip(b"=").decode()
+                for i in range(0, len(raw), CSRF_TOKEN_BYTES)
+            )
+
+def _is_session_expired(request: Request, max_age_hours: int = 24) -> bool:
+    """Check if session is expired"""
+    last_activity = request.session.get("last_activity")
+    # Missing, or an old-style ISO string from before timestamps were ints
+    if not isinstance(last_activity, (int, float)):
+        return True
+    
+    return _time() - last_activity > max_age_hours * 3600
+
+def _get_session_info(request: Request) -> Dict[str, Any]:
+    """Get session debugging info"""
+    if not request.session.get("authenticated"):
+        return {"status": "not_authenticated"}
+    
+    return {
+        "status": "authenticated",
+        "username": request.session.get("username"),
+        "role": request.session.get("role"),
+        "login_time": request.session.get("login_time"),
+        "last_activity": request.session.get("last_activity"),
+        "session_keys": list(request.session.keys())
+    }
+
+class SessionManager:
+    """Production-grade session management (facade over the module functions)"""
     
-    @staticmethod
-    def get_session_info(request: Request) -> Dict[str, Any]:
-        """Get session debugging info"""
-        if not request.session.get("authenticated"):
-            return {"status": "not_authenticated"}
-        
-        return {
-            "status": "authenticated",
-            "username": request.session.get("username"),
-            "role": request.session.get("role"),
-            "login_time": request.session.get("login_time"),
-            "last_activity": request.session.get("last_activity"),
-            "session_keys": list(request.session.keys())
-        }
-
-# FastAPI Dependencies
-def get_current_user_session(request: Request) -> Dict[str, Any]:
-    """FastAPI dependency for getting current user from session"""
-    return SessionManager.require_auth(request)
-
-def get_admin_user_session(request: Request) -> Dict[str, Any]:
-    """FastAPI dependency for admin-only routes"""
-    return SessionManager.require_role(request, "admin")
-
-def get_optional_user_session(request: Request) -> Optional[Dict[str, Any]]:
-    """FastAPI dependency for optional authentication"""
-    return SessionManager.get_current_user(request)
\ No newline at end of file
+    create_user_session = staticmethod(_create_user_session)
+    get_current_user = staticmethod(_get_current_user)
+    get_display_name = staticmethod(_get_display_name)
+    update_session = staticmethod(_update_session)
+    clear_session = staticmethod(_clear_session)
+    require_auth = staticmethod(_require_auth)
+    require_role = staticmethod(_require_role)
+    get_session_info = staticmethod(_get_session_info)
+    _generate_csrf_token = staticmethod(_generate_csrf_token)
+    _is_session_expired = staticmethod(_is_session_expired)